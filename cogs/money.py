@@ -1,40 +1,382 @@
+import aiohttp
 import aiosqlite
-from discord.ext import commands
+import asyncio
+import concurrent.futures
+from aiosqlitepool import SQLiteConnectionPool
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import partial
+from discord.ext import commands, tasks
 from discord.ext.commands import Context
 import discord
-import matplotlib.pyplot as plt
+import matplotlib
+from matplotlib.figure import Figure
 import io
+import sqlite3
 from discord import File
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import Final, Optional
+import time
 from PIL import Image
 import numpy as np
 
+# Rendering only ever goes to PNG buffers, so skip loading a GUI backend
+matplotlib.use("Agg")
+
+DATABASE_PATH = "database/pokerbot.db"
+# Bumped whenever `MoneyManager._migrate` learns a new migration
+SCHEMA_VERSION = 3
+# How long, in seconds, a leaderboard may be reused while nothing it shows has changed
+LEADERBOARD_TTL = 15
+# The most rows a leaderboard shows, since an embed holds at most 25 fields
+LEADERBOARD_MAX_ROWS = 25
+# The most recent balance changes plotted per user by the history command
+HISTORY_LIMIT = 500
+# How many days back the history command plots by default
+HISTORY_DAYS = 30
+# The longest window, in days, the history command accepts
+HISTORY_MAX_DAYS = 3650
+# Games played are written in batches of up to this many rows, at most this many seconds after the first is queued
+TRACK_BATCH_SIZE = 100
+TRACK_FLUSH_INTERVAL = 0.25
+# Balance change log rows are grouped the same way, over a shorter window
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 0.02
+# A batch that fails to write is retried this many times, waiting a little longer before each attempt
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY = 0.5
+# How long, in seconds, an avatar download may take before it is skipped
+AVATAR_TIMEOUT = 5
+
+# Hot statements are kept as constants so every call hits sqlite3's statement cache with the same text
+SQL_INIT_USER: Final[str] = "INSERT OR IGNORE INTO users (user_id, balance) VALUES (?, 0)"
+SQL_UPDATE: Final[str] = "UPDATE users SET balance = balance + ? WHERE user_id = ?"
+SQL_UPSERT: Final[str] = (
+    "INSERT INTO users (user_id, balance) VALUES (?, ?) "
+    "ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance RETURNING balance"
+)
+SQL_LOG_CHANGE: Final[str] = (
+    "INSERT INTO balance_changes (user_id, change, reason, running_balance, timestamp) VALUES (?, ?, ?, ?, ?)"
+)
+SQL_GET: Final[str] = "SELECT balance FROM users WHERE user_id = ?"
+SQL_TOP: Final[str] = "SELECT user_id, balance FROM users ORDER BY balance DESC LIMIT ?"
+SQL_SUM: Final[str] = "SELECT SUM(balance) FROM users"
+SQL_TRACK_GAME: Final[str] = "INSERT INTO games_played (user_id, timestamp, hour_bucket) VALUES (?, ?, ?)"
+SQL_GAMES_PLAYED: Final[str] = "SELECT COUNT(DISTINCT hour_bucket) FROM games_played WHERE user_id = ?"
+
+
+async def connect(path: str = DATABASE_PATH) -> aiosqlite.Connection:
+    """
+    Opens a connection to the money database with the tuned PRAGMAs applied.
+
+    :param path: The path of the database file.
+    :return: The opened connection.
+    """
+    # isolation_level=None leaves transactions to explicit BEGIN/SAVEPOINT statements instead of implicit ones
+    connection = await aiosqlite.connect(path, isolation_level=None, cached_statements=256)
+    # WAL lets readers run alongside the writer and NORMAL sync avoids an fsync per commit
+    await connection.execute("PRAGMA journal_mode=WAL;")
+    await connection.execute("PRAGMA synchronous=NORMAL;")
+    await connection.execute("PRAGMA temp_store=MEMORY;")
+    await connection.execute("PRAGMA cache_size=-64000;")
+    # Keep dirty pages in the page cache until commit rather than spilling them mid-transaction
+    await connection.execute("PRAGMA cache_spill=OFF;")
+    await connection.execute("PRAGMA mmap_size=268435456;")
+    await connection.execute("PRAGMA busy_timeout=5000;")
+    return connection
+
+
+async def run(connection: aiosqlite.Connection, fn):
+    """
+    Runs a synchronous function against the underlying sqlite3 connection on the connection's own thread.
+
+    Everything `fn` does costs a single trip to that thread, where each aiosqlite call costs at least one.
+
+    :param connection: The connection to run on.
+    :param fn: A function taking the sqlite3 connection.
+    :return: Whatever `fn` returns.
+    """
+    # aiosqlite has no public hook for this; `_execute` is what its own methods queue their work through.
+    # These are internals, so requirements.txt pins aiosqlite to the release range this was tested against
+    return await connection._execute(fn, connection._conn)
+
+
+def _atomic(fn, connection: sqlite3.Connection):
+    """
+    Calls `fn` inside a savepoint, rolling back everything it did if it raises.
+
+    :param fn: A function taking the sqlite3 connection.
+    :param connection: The sqlite3 connection.
+    :return: Whatever `fn` returns.
+    """
+    connection.execute("SAVEPOINT sp")
+    try:
+        result = fn(connection)
+    except BaseException:
+        connection.execute("ROLLBACK TO sp")
+        connection.execute("RELEASE sp")
+        raise
+    connection.execute("RELEASE sp")
+    return result
+
+
+def _current_balances(connection: sqlite3.Connection, user_ids: list) -> dict:
+    """
+    Reads several users' balances inside the surrounding transaction.
+
+    :param connection: The sqlite3 connection the surrounding transaction is running on.
+    :param user_ids: The IDs of the users.
+    :return: A dict mapping each existing user ID to their balance.
+    """
+    placeholders = ", ".join("?" * len(user_ids))
+    return dict(
+        connection.execute(f"SELECT user_id, balance FROM users WHERE user_id IN ({placeholders})", user_ids).fetchall()
+    )
+
+
+def _write_changes(connection: sqlite3.Connection, pairs: list, reason: str, balances: dict) -> list:
+    """
+    Applies balance changes without committing them.
+
+    :param connection: The sqlite3 connection the surrounding transaction is running on.
+    :param pairs: A list of (change, user_id) tuples.
+    :param reason: The reason for the balance changes.
+    :param balances: The current balance of every user in `pairs`, updated in place.
+    :return: The rows to log once the changes are committed.
+    """
+    log = []
+    for change, user_id in pairs:
+        balances[user_id] += change
+        log.append(_change_row(user_id, change, reason, balances[user_id]))
+    connection.executemany(SQL_UPDATE, pairs)
+    return log
+
+
+def _to_cents(amount: float) -> int:
+    """
+    Converts an amount of dollars entered by a user to whole cents.
+
+    :param amount: The amount in dollars.
+    :return: The amount in cents.
+    """
+    return round(amount * 100)
+
+
+def _game_row(user_id: int) -> tuple:
+    """
+    Builds the parameters for recording a game played now.
+
+    :param user_id: The ID of the user.
+    :return: The user ID, the UTC timestamp and the hour bucket that games are counted by.
+    """
+    now = datetime.utcnow()
+    return user_id, now, int(now.replace(tzinfo=timezone.utc).timestamp()) // 3600
+
+
+def _change_row(user_id: int, change: int, reason: str, balance: int) -> tuple:
+    """
+    Builds the parameters for logging a balance change made now.
+
+    :param user_id: The ID of the user.
+    :param change: The amount the balance changed by.
+    :param reason: The reason for the balance change.
+    :param balance: The user's balance after the change.
+    :return: The row in the column order of `SQL_LOG_CHANGE`, timestamped like CURRENT_TIMESTAMP.
+    """
+    return user_id, change, reason, balance, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _fmt(cents: int) -> str:
+    """
+    Formats an amount of money, e.g. `$12.50` or `-$3.00`.
+
+    :param cents: The amount to format, in cents.
+    :return: The formatted amount.
+    """
+    return f"-${-cents / 100:.2f}" if cents < 0 else f"${cents / 100:.2f}"
+
+
+def _render_png(lines: list) -> bytes:
+    """
+    Plots balance history lines. This is CPU-bound and meant to run in a worker thread.
+
+    :param lines: A list of (label, timestamps, balances, color) tuples, where color may be None.
+    :return: The rendered PNG image.
+    """
+    # A standalone Figure avoids pyplot's global state, so several renders can run at once
+    fig = Figure()
+    ax = fig.subplots()
+    for label, timestamps, balances, color in lines:
+        # Users without a usable avatar get the next default line color
+        ax.plot(timestamps, balances, label=label, color=color)
+    ax.set_xlabel('Timestamp')
+    ax.set_ylabel('Balance')
+    ax.legend()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
 
 class MoneyManager:
-    def __init__(self, *, connection: aiosqlite.Connection) -> None:
+    """
+    Stores user balances. All amounts are integer cents.
+    """
+
+    BALANCE_CACHE_SIZE = 1024
+
+    def __init__(self, *, connection: aiosqlite.Connection, pool: SQLiteConnectionPool = None) -> None:
+        # All writes go through `connection`; reads use `pool` when one is given
         self.connection = connection
+        self.pool = pool
+        self._bal_cache: OrderedDict[int, int] = OrderedDict()
+        self._version = 0
+        self._total: int = 0
+        # Serializes writers so one command's commit cannot land inside another's transaction
+        self._write_lock = asyncio.Lock()
+        # Balance changes waiting to be written by `log_changes`, in commit order; the owner drains it.
+        # It is unbounded on purpose: rows are queued right after their write commits, without awaiting, which
+        # keeps them in commit order, and blocking there on a full queue could not make room anyway since
+        # draining it needs the write lock too. It only grows while writes to the log keep failing.
+        self.change_log: asyncio.Queue[Optional[tuple]] = asyncio.Queue()
+
+    @asynccontextmanager
+    async def _reader(self):
+        """
+        Yields a connection to run read-only queries on.
+        """
+        if self.pool is None:
+            yield self.connection
+        else:
+            async with self.pool.connection() as connection:
+                yield connection
+
+    async def write(self, fn):
+        """
+        Runs `fn` on the writer connection's thread as one unit, rolling back everything it did if it raises.
+
+        :param fn: A function taking the writer's sqlite3 connection.
+        :return: Whatever `fn` returns.
+        """
+        async with self._write_lock:
+            return await run(self.connection, partial(_atomic, fn))
+
+    def _cache_balance(self, user_id: int, balance: int) -> None:
+        """
+        Stores a user's balance in the cache, evicting the least recently used entry when full.
+
+        :param user_id: The ID of the user.
+        :param balance: The user's balance.
+        """
+        self._bal_cache[user_id] = balance
+        self._bal_cache.move_to_end(user_id)
+        if len(self._bal_cache) > self.BALANCE_CACHE_SIZE:
+            self._bal_cache.popitem(last=False)
+
+    async def _migrate(self) -> None:
+        """
+        Upgrades an existing database to the current schema version.
+        """
+        async with self.connection.execute("PRAGMA user_version") as cursor:
+            (version,) = await cursor.fetchone()
+        if version >= SCHEMA_VERSION:
+            return
+
+        async with self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+        ) as cursor:
+            has_tables = await cursor.fetchone() is not None
+
+        # Each step bumps user_version in its own transaction so a failed later step never reruns an earlier one
+        if has_tables and version < 1:
+            # Version 1: balances and changes move from REAL dollars to INTEGER cents
+            await self.connection.executescript(
+                """
+                BEGIN;
+                CREATE TABLE users_new (
+                    user_id INTEGER PRIMARY KEY,
+                    balance INTEGER NOT NULL
+                );
+                INSERT INTO users_new (user_id, balance)
+                SELECT user_id, CAST(ROUND(balance * 100) AS INTEGER) FROM users;
+                DROP TABLE users;
+                ALTER TABLE users_new RENAME TO users;
+                CREATE TABLE balance_changes_new (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    change INTEGER NOT NULL,
+                    reason TEXT,
+                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                );
+                INSERT INTO balance_changes_new (id, user_id, change, reason, timestamp)
+                SELECT id, user_id, CAST(ROUND(change * 100) AS INTEGER), reason, timestamp FROM balance_changes;
+                DROP TABLE balance_changes;
+                ALTER TABLE balance_changes_new RENAME TO balance_changes;
+                PRAGMA user_version = 1;
+                COMMIT;
+                """
+            )
+        if has_tables and version < 2:
+            # Version 2: each change records the balance it left the user with, backfilled from the prefix sums
+            await self.connection.executescript(
+                """
+                BEGIN;
+                ALTER TABLE balance_changes ADD COLUMN running_balance INTEGER;
+                UPDATE balance_changes
+                SET running_balance = history.running
+                FROM (
+                    SELECT id, SUM(change) OVER (PARTITION BY user_id ORDER BY timestamp, id) AS running
+                    FROM balance_changes
+                ) AS history
+                WHERE balance_changes.id = history.id;
+                PRAGMA user_version = 2;
+                COMMIT;
+                """
+            )
+        if has_tables and version < 3:
+            # Version 3: games are counted per distinct hour using a precomputed integer bucket, which
+            # leaves nothing reading the (user_id, timestamp) index
+            await self.connection.executescript(
+                """
+                BEGIN;
+                ALTER TABLE games_played ADD COLUMN hour_bucket INTEGER NOT NULL DEFAULT 0;
+                UPDATE games_played SET hour_bucket = CAST(strftime('%s', timestamp) AS INTEGER) / 3600;
+                DROP INDEX IF EXISTS idx_gp_user_ts;
+                PRAGMA user_version = 3;
+                COMMIT;
+                """
+            )
+        # A fresh database is created at the current schema by `initialize`
+        await self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        await self.connection.commit()
 
     async def initialize(self) -> None:
         """
         Initializes the database tables if they do not exist.
         """
+        await self._migrate()
         await self.connection.execute(
             """
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER PRIMARY KEY,
-                balance REAL NOT NULL
+                balance INTEGER NOT NULL
             )
             """
         )
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_balance ON users(balance DESC)"
+        )
         await self.connection.execute(
             """
             CREATE TABLE IF NOT EXISTS balance_changes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
-                change REAL NOT NULL,
+                change INTEGER NOT NULL,
                 reason TEXT,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                running_balance INTEGER,
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
             """
@@ -44,57 +386,133 @@ class MoneyManager:
             CREATE TABLE IF NOT EXISTS games_played (
                 user_id INTEGER NOT NULL,
                 timestamp DATETIME NOT NULL,
+                hour_bucket INTEGER NOT NULL,
                 FOREIGN KEY (user_id) REFERENCES users(user_id)
             )
             """
         )
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_bc_user_ts ON balance_changes(user_id, timestamp)"
+        )
+        await self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_gp_user_bucket ON games_played(user_id, hour_bucket)"
+        )
         await self.connection.commit()
 
-    async def initialize_user(self, user_id: int) -> None:
+    async def load(self) -> None:
+        """
+        Loads the sum of all balances from the database into memory.
+        """
+        # Holding the write lock keeps the sum from seeing a write whose delta is added to the total afterwards
+        async with self._write_lock:
+            async with self.connection.execute(SQL_SUM) as cursor:
+                result = await cursor.fetchone()
+                self._total = result[0] if result and result[0] is not None else 0
+
+    @property
+    def version(self) -> int:
         """
-        Ensures a user exists in the database with a default balance of 0.
+        A counter that increases every time a balance or game is written.
+        """
+        return self._version
 
-        :param user_id: The ID of the user.
+    @property
+    def total_balance(self) -> int:
         """
-        await self.connection.execute(
-            """
-            INSERT OR IGNORE INTO users (user_id, balance)
-            VALUES (?, 0)
-            """,
-            (user_id,),
-        )
-        await self.connection.commit()
+        The sum of all user balances, kept up to date by every write.
+        """
+        return self._total
 
-    async def update_balance(self, user_id: int, change: float, reason: str = None) -> None:
+    async def adjust_and_get(self, user_id: int, amount: int, reason: str = None) -> int:
         """
-        Updates a user's balance and logs the change.
+        Creates the user if needed, adjusts their balance, queues the change to be logged and returns the new balance.
 
         :param user_id: The ID of the user.
-        :param change: The amount to add or subtract from the user's balance.
+        :param amount: The amount to add or subtract from the user's balance.
         :param reason: The reason for the balance change.
+        :return: The user's new balance.
         """
-        async with self.connection.execute(
-            "UPDATE users SET balance = balance + ? WHERE user_id = ?", (change, user_id)
-        ):
-            await self.connection.commit()
-        
-        async with self.connection.execute(
-            "INSERT INTO balance_changes (user_id, change, reason) VALUES (?, ?, ?)", (user_id, change, reason)
-        ):
-            await self.connection.commit()
+        balance = await self.write(lambda connection: connection.execute(SQL_UPSERT, (user_id, amount)).fetchone()[0])
+        self.change_log.put_nowait(_change_row(user_id, amount, reason, balance))
+        self._total += amount
+        self._version += 1
+        self._cache_balance(user_id, balance)
+        return balance
+
+    async def bulk_adjust(self, pairs: list, reason: str = None) -> None:
+        """
+        Creates any missing users and updates their balances in a single transaction, then queues the changes to be logged.
+
+        :param pairs: A list of (change, user_id) tuples.
+        :param reason: The reason for the balance changes.
+        """
+        def apply(connection: sqlite3.Connection) -> list:
+            connection.executemany(SQL_INIT_USER, [(user_id,) for _, user_id in pairs])
+            balances = _current_balances(connection, [user_id for _, user_id in pairs])
+            return _write_changes(connection, pairs, reason, balances)
+
+        log = await self.write(apply)
+        self._changes_committed(pairs, log)
+
+    async def bulk_set(self, user_ids: list, balance: int, reason: str = None) -> None:
+        """
+        Creates any missing users and sets their balances in a single transaction, then queues the differences to be logged.
+
+        :param user_ids: The IDs of the users.
+        :param balance: The balance to set.
+        :param reason: The reason for the balance changes.
+        """
+        def apply(connection: sqlite3.Connection) -> tuple:
+            connection.executemany(SQL_INIT_USER, [(user_id,) for user_id in user_ids])
+            balances = _current_balances(connection, user_ids)
+            pairs = [(balance - current, user_id) for user_id, current in balances.items()]
+            return pairs, _write_changes(connection, pairs, reason, balances)
 
-    async def get_balance(self, user_id: int) -> float:
+        pairs, log = await self.write(apply)
+        self._changes_committed(pairs, log)
+
+    def _changes_committed(self, pairs: list, log: list) -> None:
+        """
+        Queues the changes to be logged and brings the in-memory total and balance cache up to date.
+
+        :param pairs: A list of (change, user_id) tuples.
+        :param log: The rows to log for the changes.
+        """
+        for row in log:
+            self.change_log.put_nowait(row)
+        self._total += sum(change for change, _ in pairs)
+        self._version += 1
+        for _, user_id in pairs:
+            self._bal_cache.pop(user_id, None)
+
+    async def log_changes(self, rows: list) -> None:
+        """
+        Writes several queued balance changes to the log in a single transaction.
+
+        :param rows: A list of rows as built by `_change_row`.
+        """
+        await self.write(lambda connection: connection.executemany(SQL_LOG_CHANGE, rows))
+
+    async def get_balance(self, user_id: int) -> int:
         """
         Retrieves a user's balance.
 
         :param user_id: The ID of the user.
         :return: The user's balance.
         """
-        async with self.connection.execute(
-            "SELECT balance FROM users WHERE user_id = ?", (user_id,)
-        ) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else 0.0
+        if user_id in self._bal_cache:
+            self._bal_cache.move_to_end(user_id)
+            return self._bal_cache[user_id]
+
+        version = self._version
+        async with self._reader() as connection:
+            async with connection.execute(SQL_GET, (user_id,)) as cursor:
+                result = await cursor.fetchone()
+                balance = result[0] if result else 0
+        # A write that landed while we were reading may have made this value stale
+        if version == self._version:
+            self._cache_balance(user_id, balance)
+        return balance
 
     async def get_leaderboard(self, limit: int = 10) -> list:
         """
@@ -103,23 +521,100 @@ class MoneyManager:
         :param limit: The number of top users to retrieve.
         :return: A list of tuples containing user_id and balance.
         """
-        async with self.connection.execute(
-            "SELECT user_id, balance FROM users ORDER BY balance DESC LIMIT ?",
-            (limit,),
-        ) as cursor:
-            return await cursor.fetchall()
+        async with self._reader() as connection:
+            async with connection.execute(SQL_TOP, (limit,)) as cursor:
+                return await cursor.fetchall()
 
-    async def track_game(self, user_id: int) -> None:
+    async def get_user_ids(self) -> list:
         """
-        Tracks a game played by the user.
+        Retrieves the IDs of every user.
 
-        :param user_id: The ID of the user.
+        :return: A list of user IDs.
         """
-        await self.connection.execute(
-            "INSERT INTO games_played (user_id, timestamp) VALUES (?, ?)",
-            (user_id, datetime.utcnow())
-        )
-        await self.connection.commit()
+        async with self._reader() as connection:
+            async with connection.execute("SELECT user_id FROM users") as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    async def get_users_with_history(self) -> list:
+        """
+        Retrieves the IDs of every user with at least one logged balance change.
+
+        :return: A list of user IDs.
+        """
+        async with self._reader() as connection:
+            async with connection.execute("SELECT DISTINCT user_id FROM balance_changes") as cursor:
+                return [row[0] for row in await cursor.fetchall()]
+
+    async def get_balance_histories(self, user_ids: list, since: datetime, limit: int = HISTORY_LIMIT) -> dict:
+        """
+        Retrieves several users' balances after each of their most recent balance changes since a point in time.
+
+        :param user_ids: The IDs of the users.
+        :param since: The UTC time to start the histories at.
+        :param limit: The maximum number of changes to retrieve per user.
+        :return: A dict mapping each user ID with history to a list of (timestamp, running balance) tuples, oldest first.
+            Users with fewer than `limit` changes since then start with their balance at `since`, if they had one.
+        """
+        placeholders = ", ".join("?" * len(user_ids))
+        cutoff = since.strftime('%Y-%m-%d %H:%M:%S')
+
+        def fetch(connection: sqlite3.Connection) -> tuple:
+            rows = connection.execute(
+                f"""
+                SELECT user_id, timestamp, running_balance
+                FROM (
+                    SELECT user_id, timestamp, id, running_balance, ROW_NUMBER() OVER (
+                        PARTITION BY user_id ORDER BY timestamp DESC, id DESC
+                    ) AS recency
+                    FROM balance_changes
+                    WHERE user_id IN ({placeholders}) AND timestamp >= ?
+                )
+                WHERE recency <= ?
+                ORDER BY user_id, timestamp, id
+                """,
+                # One row past the limit tells a truncated history apart from one that is exactly `limit` long
+                (*user_ids, cutoff, limit + 1),
+            ).fetchall()
+            # The running balance of each user's last change before the window is their balance at its start
+            baselines = connection.execute(
+                f"""
+                SELECT user_id, running_balance
+                FROM (
+                    SELECT user_id, running_balance, ROW_NUMBER() OVER (
+                        PARTITION BY user_id ORDER BY timestamp DESC, id DESC
+                    ) AS recency
+                    FROM balance_changes
+                    WHERE user_id IN ({placeholders}) AND timestamp < ?
+                )
+                WHERE recency = 1
+                """,
+                (*user_ids, cutoff),
+            ).fetchall()
+            return rows, dict(baselines)
+
+        async with self._reader() as connection:
+            rows, baselines = await run(connection, fetch)
+        histories = {
+            user_id: [(timestamp, running) for _, timestamp, running in group]
+            for user_id, group in groupby(rows, key=lambda row: row[0])
+        }
+        for user_id, history in histories.items():
+            # A truncated history does not reach back to the start of the window
+            if len(history) > limit:
+                del history[0]
+                baselines.pop(user_id, None)
+        for user_id, running in baselines.items():
+            histories.setdefault(user_id, []).insert(0, (cutoff, running))
+        return histories
+
+    async def track_games(self, rows: list) -> None:
+        """
+        Records several games played in a single transaction.
+
+        :param rows: A list of (user_id, timestamp, hour_bucket) tuples as built by `_game_row`.
+        """
+        await self.write(lambda connection: connection.executemany(SQL_TRACK_GAME, rows))
+        self._version += 1
 
     async def get_games_played(self, user_id: int) -> int:
         """
@@ -128,12 +623,10 @@ class MoneyManager:
         :param user_id: The ID of the user.
         :return: The number of games played.
         """
-        async with self.connection.execute(
-            "SELECT COUNT(DISTINCT strftime('%Y-%m-%d %H', timestamp)) FROM games_played WHERE user_id = ?",
-            (user_id,)
-        ) as cursor:
-            result = await cursor.fetchone()
-            return result[0] if result else 0
+        async with self._reader() as connection:
+            async with connection.execute(SQL_GAMES_PLAYED, (user_id,)) as cursor:
+                result = await cursor.fetchone()
+                return result[0] if result else 0
 
     async def get_game_leaderboard(self, limit: int = 10) -> list:
         """
@@ -142,33 +635,217 @@ class MoneyManager:
         :param limit: The number of top users to retrieve.
         :return: A list of tuples containing user_id and games played.
         """
-        async with self.connection.execute(
-            """
-            SELECT user_id, COUNT(DISTINCT strftime('%Y-%m-%d %H', timestamp)) as games_played
-            FROM games_played
-            GROUP BY user_id
-            ORDER BY games_played DESC
-            LIMIT ?
-            """,
-            (limit,)
-        ) as cursor:
-            return await cursor.fetchall()
+        async with self._reader() as connection:
+            async with connection.execute(
+                """
+                SELECT user_id, COUNT(*) as games_played
+                FROM (SELECT DISTINCT user_id, hour_bucket FROM games_played)
+                GROUP BY user_id
+                ORDER BY games_played DESC
+                LIMIT ?
+                """,
+                (limit,)
+            ) as cursor:
+                return await cursor.fetchall()
 
 
 class MoneyCog(commands.Cog, name="money"):
     def __init__(self, bot) -> None:
         self.bot = bot
         self.db_manager = None
+        self.db_pool = None
+        self.http_session = None
+        self._plot_pool = None
+        self._pending: set[asyncio.Task] = set()
+        # Games played waiting to be written; None tells the writer to stop
+        self._track_queue: asyncio.Queue[Optional[tuple]] = asyncio.Queue()
+        self._writer_tasks: list[asyncio.Task] = []
+        # Leaderboard rows by query: (timestamp, version, rows requested, [((user_id, value), user), ...])
+        self._lb_caches: dict[str, tuple[float, int, int, list]] = {}
+        # Users fetched from the API; only names and avatars are read from them, so they are never refreshed
+        self._user_cache: dict[int, discord.User] = {}
+        # Mean avatar colors keyed by the avatar's CDN hash, which changes whenever the avatar does
+        self._avatar_color: dict[str, tuple] = {}
 
     async def cog_load(self) -> None:
-        # Initialize the database connection and manager
-        self.bot.db_connection = await aiosqlite.connect("database/pokerbot.db")
-        self.db_manager = MoneyManager(connection=self.bot.db_connection)
+        # Initialize the writer connection, the reader pool and the manager
+        self.bot.db_connection = await connect()
+        self.db_pool = SQLiteConnectionPool(connect, pool_size=8)
+        self.db_manager = MoneyManager(connection=self.bot.db_connection, pool=self.db_pool)
         await self.db_manager.initialize()
+        await self.db_manager.load()
+        self.reconcile_total.start()
+        self._writer_tasks = [
+            asyncio.create_task(self._batch_writer(
+                self._track_queue, self.db_manager.track_games, TRACK_BATCH_SIZE, TRACK_FLUSH_INTERVAL
+            )),
+            asyncio.create_task(self._batch_writer(
+                self.db_manager.change_log, self.db_manager.log_changes, LOG_BATCH_SIZE, LOG_FLUSH_INTERVAL
+            )),
+        ]
+        self.http_session = aiohttp.ClientSession()
+        self._plot_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
 
     async def cog_unload(self) -> None:
+        self.reconcile_total.cancel()
+        # Finish sending any replies still in flight; their failures are logged by `_sent_in_background`
+        await asyncio.gather(*self._pending, return_exceptions=True)
+        # Let the writers flush whatever is still queued before the connection closes
+        self._track_queue.put_nowait(None)
+        self.db_manager.change_log.put_nowait(None)
+        await asyncio.gather(*self._writer_tasks)
+        self._plot_pool.shutdown(wait=False)
+        await self.http_session.close()
+        await self.db_pool.close()
         await self.bot.db_connection.close()
 
+    @tasks.loop(minutes=30.0)
+    async def reconcile_total(self) -> None:
+        """
+        Recomputes the in-memory balance total from the database to pick up any changes made outside the bot.
+        """
+        await self.db_manager.load()
+
+    async def _batch_writer(self, queue: asyncio.Queue, write, batch_size: int, interval: float) -> None:
+        """
+        Drains a queue in batches, handing each batch to `write`, until it receives None.
+
+        :param queue: The queue of rows to write.
+        :param write: The coroutine function that writes a list of rows.
+        :param batch_size: The most rows to write at once.
+        :param interval: How long, in seconds, to wait for more rows after the first of a batch arrives.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await queue.get()
+            rows = []
+            deadline = loop.time() + interval
+            while row is not None:
+                rows.append(row)
+                if len(rows) == batch_size:
+                    break
+                try:
+                    row = await asyncio.wait_for(queue.get(), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+            if rows:
+                await self._write_batch(write, rows)
+            if row is None:
+                return
+
+    async def _write_batch(self, write, rows: list) -> None:
+        """
+        Writes a batch of rows, retrying with a growing delay before giving up on it.
+
+        Later rows wait behind the batch, so rows are still written in the order they were queued.
+
+        :param write: The coroutine function that writes a list of rows.
+        :param rows: The rows to write.
+        """
+        for attempt in range(WRITE_RETRIES + 1):
+            try:
+                await write(rows)
+                return
+            except Exception as e:
+                exception = f"{type(e).__name__}: {e}"
+            if attempt < WRITE_RETRIES:
+                self.bot.logger.warning(
+                    f"Failed to write {len(rows)} rows with {write.__name__}, retrying\n{exception}"
+                )
+                await asyncio.sleep(WRITE_RETRY_DELAY * (attempt + 1))
+        self.bot.logger.error(
+            f"Dropped {len(rows)} rows after {WRITE_RETRIES + 1} failed attempts with {write.__name__}\n{exception}"
+        )
+
+    def track_game(self, user_id: int) -> None:
+        """
+        Queues a game played by the user to be recorded without waiting for the write.
+
+        :param user_id: The ID of the user.
+        """
+        self._track_queue.put_nowait(_game_row(user_id))
+
+    def send_in_background(self, context: Context, **kwargs) -> None:
+        """
+        Sends a message without making the command wait for the Discord round-trip.
+
+        :param context: The command context.
+        :param kwargs: The arguments to pass to `context.send`.
+        """
+        task = asyncio.create_task(context.send(**kwargs))
+        # Keep a reference so the task is not garbage collected before it finishes
+        self._pending.add(task)
+        task.add_done_callback(self._sent_in_background)
+
+    def _sent_in_background(self, task: asyncio.Task) -> None:
+        """
+        Forgets a finished background send, logging it if it failed since nothing awaits it.
+
+        :param task: The finished task.
+        """
+        self._pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            exception = f"{type(task.exception()).__name__}: {task.exception()}"
+            self.bot.logger.error(f"Failed to send a message in the background\n{exception}")
+
+    async def fetch_user(self, user_id: int) -> discord.User:
+        """
+        Fetches a user from the API, remembering the result so each user is only fetched once.
+
+        :param user_id: The ID of the user.
+        :return: The user.
+        """
+        user = self._user_cache.get(user_id)
+        if user is None:
+            user = await self.bot.fetch_user(user_id)
+            self._user_cache[user_id] = user
+        return user
+
+    async def resolve_users(self, user_ids: list) -> list:
+        """
+        Resolves user IDs to users, using the bot's cache first and fetching the misses concurrently.
+
+        :param user_ids: The IDs of the users.
+        :return: A list of users in the same order, with None for users that could not be fetched.
+        """
+        users = [self.bot.get_user(user_id) or self._user_cache.get(user_id) for user_id in user_ids]
+        missing = [index for index, user in enumerate(users) if user is None]
+        fetched = await asyncio.gather(
+            *(self.fetch_user(user_ids[index]) for index in missing), return_exceptions=True
+        )
+        for index, user in zip(missing, fetched):
+            users[index] = None if isinstance(user, BaseException) else user
+        return users
+
+    async def _cached_rows(self, context: Context, query, top_n: int) -> list:
+        """
+        Reads the top rows of a leaderboard with their users resolved, reusing a recent result while nothing it shows has changed.
+
+        :param context: The command context, deferred while the rows are read.
+        :param query: The `MoneyManager` method that reads the top rows, given how many to read.
+        :param top_n: The number of rows to return.
+        :return: A list of ((user_id, value), user) tuples, or None if `top_n` was out of range and the user was told.
+        """
+        if not 1 <= top_n <= LEADERBOARD_MAX_ROWS:
+            await context.send(f"The number of users to show must be between 1 and {LEADERBOARD_MAX_ROWS}.")
+            return None
+
+        timestamp, version, cached_n, cached = self._lb_caches.get(query.__name__, (0.0, 0, 0, []))
+        if (
+            time.monotonic() - timestamp < LEADERBOARD_TTL
+            and version == self.db_manager.version
+            and cached_n >= top_n
+        ):
+            return cached[:top_n]
+
+        version = self.db_manager.version
+        # Acknowledge the interaction while the rows are being read rather than after
+        _, rows = await asyncio.gather(context.defer(), query(top_n))
+        users = await self.resolve_users([user_id for user_id, _ in rows])
+        entries = list(zip(rows, users))
+        self._lb_caches[query.__name__] = (time.monotonic(), version, top_n, entries)
+        return entries
+
     @commands.hybrid_command(
         name="profit",
         description="Adjust your balance by a specific amount."
@@ -180,19 +857,18 @@ class MoneyCog(commands.Cog, name="money"):
         :param context: The command context.
         :param amount: The amount to add or subtract from the user's balance.
         """
-        user_id = context.author.id
-        await self.db_manager.initialize_user(user_id)
-        await self.db_manager.update_balance(user_id, amount)
-        await self.db_manager.track_game(user_id)
-        new_balance = await self.db_manager.get_balance(user_id)
+        author = context.author
+        user_id = author.id
+        new_balance = await self.db_manager.adjust_and_get(user_id, _to_cents(amount))
+        self.track_game(user_id)
         
         embed = discord.Embed(
             title="Balance Update",
-            description=f"{context.author.mention}, your new balance is: **{'-$' if new_balance < 0 else '$'}{abs(new_balance):.2f}**",
+            description=f"{author.mention}, your new balance is: **{_fmt(new_balance)}**",
             color=discord.Color.green()
         )
         
-        await context.send(embed=embed)
+        self.send_in_background(context, embed=embed)
 
     @commands.hybrid_command(
         name="balance",
@@ -204,17 +880,17 @@ class MoneyCog(commands.Cog, name="money"):
 
         :param context: The command context.
         """
-        user_id = context.author.id
-        await self.db_manager.initialize_user(user_id)
+        author = context.author
+        user_id = author.id
         balance = await self.db_manager.get_balance(user_id)
         
         embed = discord.Embed(
             title="Balance Check",
-            description=f"{context.author.mention}, your current balance is: **{'-$' if balance < 0 else '$'}{abs(balance):.2f}**",
+            description=f"{author.mention}, your current balance is: **{_fmt(balance)}**",
             color=discord.Color.blue()
         )
         
-        await context.send(embed=embed)
+        self.send_in_background(context, embed=embed)
 
     @commands.hybrid_command(
         name="leaderboard",
@@ -227,8 +903,11 @@ class MoneyCog(commands.Cog, name="money"):
         :param context: The command context.
         :param top_n: The number of top users to display.
         """
-        top_users = await self.db_manager.get_leaderboard(top_n)
-        if not top_users:
+        entries = await self._cached_rows(context, self.db_manager.get_leaderboard, top_n)
+        if entries is None:
+            return
+
+        if not entries:
             await context.send("The leaderboard is empty!")
             return
 
@@ -238,17 +917,11 @@ class MoneyCog(commands.Cog, name="money"):
             color=discord.Color.gold()
         )
 
-        for rank, (user_id, balance) in enumerate(top_users, start=1):
-            try:
-                user = await self.bot.fetch_user(user_id)
-                username = user.mention if user else f"User {user_id}"
-            except Exception:
-                username = f"User {user_id}"
-
-            username.replace("@", "@$")
+        for rank, ((user_id, balance), user) in enumerate(entries, start=1):
+            username = user.mention if user else f"User {user_id}"
             embed.add_field(
                 name=f"**#{rank}**",
-                value=f"{username}: **{'-$' if balance < 0 else '$'}{abs(balance):.2f}**",
+                value=f"{username}: **{_fmt(balance)}**",
                 inline=False
             )
 
@@ -264,23 +937,19 @@ class MoneyCog(commands.Cog, name="money"):
 
         :param context: The command context.
         """
-        async with self.bot.db_connection.execute(
-            "SELECT SUM(balance) FROM users"
-        ) as cursor:
-            result = await cursor.fetchone()
-            total_balance = result[0] if result else 0.0
+        total_balance = self.db_manager.total_balance
 
         detail = "Money needs to be removed among users." if total_balance > 0 else "Money needs to be added among users."
-        if abs(total_balance) < 0.01:
+        if total_balance == 0:
             detail = "Users are perfectly balanced, as all things should be."
 
         embed = discord.Embed(
             title="Excess Calculation",
-            description=f"The total discrepancy is: **{'-$' if total_balance < 0 else '$'}{abs(total_balance):.2f}**\n{detail}",
-            color=discord.Color.red() if abs(total_balance) >= 0.01 else discord.Color.green()
+            description=f"The total discrepancy is: **{_fmt(total_balance)}**\n{detail}",
+            color=discord.Color.red() if total_balance != 0 else discord.Color.green()
         )
         
-        await context.send(embed=embed)
+        self.send_in_background(context, embed=embed)
 
     @commands.hybrid_command(
         name="split-excess",
@@ -294,21 +963,14 @@ class MoneyCog(commands.Cog, name="money"):
         :param context: The command context.
         :param mentions: The users to split the excess with.
         """
-        async with self.bot.db_connection.execute(
-            "SELECT SUM(balance) FROM users"
-        ) as cursor:
-            result = await cursor.fetchone()
-            total_balance = result[0] if result else 0.0
+        total_balance = self.db_manager.total_balance
 
         if total_balance == 0:
             await context.send("There is no excess to split.")
             return
 
         if not mentions:
-            async with self.bot.db_connection.execute(
-                "SELECT user_id FROM users"
-            ) as cursor:
-                user_ids = [row[0] for row in await cursor.fetchall()]
+            user_ids = await self.db_manager.get_user_ids()
         else:
             user_ids = [member.id for member in mentions]
 
@@ -316,17 +978,19 @@ class MoneyCog(commands.Cog, name="money"):
             await context.send("No users found to split the excess with.")
             return
 
-        split_amount = -1 * (total_balance / len(user_ids))
-        for user_id in user_ids:
-            await self.db_manager.update_balance(user_id, split_amount)
+        # Hand out the leftover cents one each so the split always sums back to zero
+        split_amount, remainder = divmod(-total_balance, len(user_ids))
+        await self.db_manager.bulk_adjust(
+            [(split_amount + 1 if index < remainder else split_amount, user_id) for index, user_id in enumerate(user_ids)]
+        )
 
         embed = discord.Embed(
             title="Split Excess",
-            description=f"The excess of **{'-$' if total_balance < 0 else '$'}{abs(total_balance):.2f}** has been split among the {'mentioned users' if mentions else 'all users'}.",
+            description=f"The excess of **{_fmt(total_balance)}** has been split among the {'mentioned users' if mentions else 'all users'}.",
             color=discord.Color.blue()
         )
         
-        await context.send(embed=embed)
+        self.send_in_background(context, embed=embed)
 
     @commands.hybrid_command(
         name="setbalance",
@@ -345,15 +1009,12 @@ class MoneyCog(commands.Cog, name="money"):
             await context.send("You must mention at least one user to set the balance for.")
             return
 
-        for member in mentions:
-            await self.db_manager.initialize_user(member.id)
-            current_balance = await self.db_manager.get_balance(member.id)
-            change = amount - current_balance
-            await self.db_manager.update_balance(member.id, change)
+        amount = _to_cents(amount)
+        await self.db_manager.bulk_set([member.id for member in mentions], amount)
 
         embed = discord.Embed(
             title="Set Balance",
-            description=f"The balance of the mentioned users has been set to **{'-$' if amount < 0 else '$'}{abs(amount):.2f}**.",
+            description=f"The balance of the mentioned users has been set to **{_fmt(amount)}**.",
             color=discord.Color.blue()
         )
         
@@ -376,15 +1037,12 @@ class MoneyCog(commands.Cog, name="money"):
             await context.send("You must provide at least one user ID to set the balance for.")
             return
 
-        for user_id in user_ids:
-            await self.db_manager.initialize_user(user_id)
-            current_balance = await self.db_manager.get_balance(user_id)
-            change = amount - current_balance
-            await self.db_manager.update_balance(user_id, change)
+        amount = _to_cents(amount)
+        await self.db_manager.bulk_set(user_ids, amount)
 
         embed = discord.Embed(
             title="Set Balance by ID",
-            description=f"The balance of the specified users has been set to **{'-$' if amount < 0 else '$'}{abs(amount):.2f}**.",
+            description=f"The balance of the specified users has been set to **{_fmt(amount)}**.",
             color=discord.Color.blue()
         )
         
@@ -408,19 +1066,13 @@ class MoneyCog(commands.Cog, name="money"):
             await context.send("You must provide at least one user ID or mention to change the balance for.")
             return
 
-        if targets:
-            for member in targets:
-                await self.db_manager.initialize_user(member.id)
-                await self.db_manager.update_balance(member.id, amount)
-
-        if user_ids:
-            for user_id in user_ids:
-                await self.db_manager.initialize_user(user_id)
-                await self.db_manager.update_balance(user_id, amount)
+        amount = _to_cents(amount)
+        ids = [member.id for member in targets or []] + list(user_ids or [])
+        await self.db_manager.bulk_adjust([(amount, user_id) for user_id in ids])
 
         embed = discord.Embed(
             title="Change Balance",
-            description=f"The balance of the specified users has been changed by **{'-$' if amount < 0 else '$'}{abs(amount):.2f}**.",
+            description=f"The balance of the specified users has been changed by **{_fmt(amount)}**.",
             color=discord.Color.blue()
         )
         
@@ -430,18 +1082,22 @@ class MoneyCog(commands.Cog, name="money"):
         name="history",
         description="Display the balance history of mentioned users."
     )
-    async def balance_history(self, context: Context, mentions: commands.Greedy[discord.Member] = None) -> None:
+    async def balance_history(
+        self, context: Context, mentions: commands.Greedy[discord.Member] = None, days: int = HISTORY_DAYS
+    ) -> None:
         """
         Display the balance history of mentioned users or everyone if no mentions.
 
         :param context: The command context.
         :param mentions: The users to display the balance history for.
+        :param days: How many days of history to display.
         """
+        if not 1 <= days <= HISTORY_MAX_DAYS:
+            await context.send(f"The number of days must be between 1 and {HISTORY_MAX_DAYS}.")
+            return
+
         if not mentions:
-            async with self.bot.db_connection.execute(
-                "SELECT DISTINCT user_id FROM balance_changes"
-            ) as cursor:
-                user_ids = [row[0] for row in await cursor.fetchall()]
+            user_ids = await self.db_manager.get_users_with_history()
         else:
             user_ids = [member.id for member in mentions]
 
@@ -449,7 +1105,7 @@ class MoneyCog(commands.Cog, name="money"):
             await context.send("No balance history available.")
             return
 
-        file = await self.generate_balance_graph(user_ids)
+        file = await self.generate_balance_graph(user_ids, days)
         
         embed = discord.Embed(
             title="Balance History",
@@ -460,64 +1116,101 @@ class MoneyCog(commands.Cog, name="money"):
         
         await context.send(embed=embed, file=file)
 
-    async def generate_balance_graph(self, user_ids: list):
-        fig, ax = plt.subplots()
-        
+    async def fetch_avatar(self, user: Optional[discord.User]) -> Optional[bytes]:
+        """
+        Downloads a user's avatar.
+
+        :param user: The user, or None if they could not be resolved.
+        :return: The image data, or None if the user has no avatar or the download failed.
+        """
+        if user is None or user.avatar is None:
+            return None
+        try:
+            async with self.http_session.get(
+                user.avatar.url, timeout=aiohttp.ClientTimeout(total=AVATAR_TIMEOUT)
+            ) as response:
+                response.raise_for_status()
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+
+    async def avatar_colors(self, users: list) -> list:
+        """
+        Computes the mean color of several users' avatars, downloading each avatar only the first time it is seen.
+
+        :param users: The users, with None for users that could not be resolved.
+        :return: A list of RGB tuples with components between 0 and 1 in the same order, with None where there is no usable avatar.
+        """
+        keys = [None if user is None or user.avatar is None else user.avatar.key for user in users]
+        missing = {key: user for key, user in zip(keys, users) if key is not None and key not in self._avatar_color}
+        avatars = await asyncio.gather(*(self.fetch_avatar(user) for user in missing.values()))
+
+        decoded, thumbnails = [], []
+        for key, avatar in zip(missing, avatars):
+            if avatar is None:
+                continue
+            try:
+                img = Image.open(io.BytesIO(avatar)).convert("RGB")
+            except Exception:
+                continue
+            # A 32x32 thumbnail has the same mean color as the full image at a fraction of the cost,
+            # and a fixed size lets every thumbnail be averaged in a single call
+            thumbnails.append(np.asarray(img.resize((32, 32), Image.BILINEAR), dtype=np.float32))
+            decoded.append(key)
+        if thumbnails:
+            means = np.stack(thumbnails).mean(axis=(1, 2)) / 255.0
+            for key, color in zip(decoded, means.tolist()):
+                self._avatar_color[key] = tuple(color)
+
+        return [self._avatar_color.get(key) for key in keys]
+
+    async def generate_balance_graph(self, user_ids: list, days: int = HISTORY_DAYS):
+        histories = await self.db_manager.get_balance_histories(
+            user_ids, datetime.utcnow() - timedelta(days=days)
+        )
+        series = []
         for user_id in user_ids:
-            async with self.bot.db_connection.execute(
-                "SELECT change, timestamp FROM balance_changes WHERE user_id = ? ORDER BY timestamp", (user_id,)
-            ) as cursor:
-                changes = await cursor.fetchall()
+            history = histories.get(user_id)
             
-            if not changes:
+            if not history:
                 continue
             
+            # Carry the latest balance through to now as the last point
+            balances = np.array([running for _, running in history] + [history[-1][1]]) / 100
             # Convert timestamps to PST
-            timestamps = [datetime.strptime(change[1], '%Y-%m-%d %H:%M:%S') - timedelta(hours=8) for change in changes]
-            balances = [sum(change[0] for change in changes[:i+1]) for i in range(len(changes))]
-            
-            # Add current balance as the last point
-            current_balance = await self.db_manager.get_balance(user_id)
             now = datetime.utcnow() - timedelta(hours=8)
-            timestamps.append(now)
-            balances.append(current_balance)
+            first = datetime.strptime(history[0][0], '%Y-%m-%d %H:%M:%S') - timedelta(hours=8)
             
             # Determine the time span
-            time_span = (timestamps[-1] - timestamps[0]).days
+            time_span = (now - first).days
             
             if time_span > 7:
                 # More than a week of data, use days
-                formatted_timestamps = [ts.strftime('%m/%d/%y') for ts in timestamps]
-                step = max(1, len(formatted_timestamps) // 7)
+                timestamp_format, points = '%m/%d/%y', 7
             else:
                 # Less than a week of data, use hours
-                formatted_timestamps = [ts.strftime('%m/%d/%y-%I%p') for ts in timestamps]
-                step = max(1, len(formatted_timestamps) // (7 * 24))
+                timestamp_format, points = '%m/%d/%y-%I%p', 7 * 24
             
-            # Reduce data points to fit the step
-            formatted_timestamps = formatted_timestamps[::step]
-            balances = balances[::step]
-            
-            user = await self.bot.fetch_user(user_id)
-
-            user_avatar = user.avatar
-            try:
-                response = requests.get(user_avatar)
-                # get mode color of user image and set it as line color (use numpy)
-                img = Image.open(io.BytesIO(response.content))
-
-                ax.plot(formatted_timestamps, balances, label=f"{user.display_name}", color=np.array(img).mean(axis=(0,1))/255)
-            except Exception:
-                ax.plot(formatted_timestamps, balances, label=f"{user.display_name}")
-        ax.set_xlabel('Timestamp')
-        ax.set_ylabel('Balance')
-        ax.legend()
+            # Sample evenly spaced points first so only the kept timestamps are parsed and formatted
+            indices = np.linspace(0, len(balances) - 1, min(len(balances), points)).astype(int)
+            formatted_timestamps = [
+                (now if index == len(history) else datetime.strptime(history[index][0], '%Y-%m-%d %H:%M:%S') - timedelta(hours=8)).strftime(timestamp_format)
+                for index in indices
+            ]
+            balances = balances[indices].tolist()
+            series.append((user_id, formatted_timestamps, balances))
+
+        # Resolve every user and download every new avatar concurrently instead of one at a time
+        users = await self.resolve_users([user_id for user_id, _, _ in series])
+        colors = await self.avatar_colors(users)
+
+        lines = [
+            (user.display_name if user else f"User {user_id}", formatted_timestamps, balances, color)
+            for (user_id, formatted_timestamps, balances), user, color in zip(series, users, colors)
+        ]
+        png = await asyncio.get_running_loop().run_in_executor(self._plot_pool, _render_png, lines)
         
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png')
-        buf.seek(0)
-        
-        return File(buf, filename='balance_history.png')
+        return File(io.BytesIO(png), filename='balance_history.png')
 
     @commands.hybrid_command(
         name="games",
@@ -529,13 +1222,13 @@ class MoneyCog(commands.Cog, name="money"):
 
         :param context: The command context.
         """
-        user_id = context.author.id
-        await self.db_manager.initialize_user(user_id)
+        author = context.author
+        user_id = author.id
         games_played = await self.db_manager.get_games_played(user_id)
         
         embed = discord.Embed(
             title="Games Played",
-            description=f"{context.author.mention}, you have played **{games_played}** games.",
+            description=f"{author.mention}, you have played **{games_played}** games.",
             color=discord.Color.blue()
         )
         
@@ -552,8 +1245,11 @@ class MoneyCog(commands.Cog, name="money"):
         :param context: The command context.
         :param top_n: The number of top users to display.
         """
-        top_users = await self.db_manager.get_game_leaderboard(top_n)
-        if not top_users:
+        entries = await self._cached_rows(context, self.db_manager.get_game_leaderboard, top_n)
+        if entries is None:
+            return
+
+        if not entries:
             await context.send("The game leaderboard is empty.")
             return
 
@@ -563,14 +1259,8 @@ class MoneyCog(commands.Cog, name="money"):
             color=discord.Color.gold()
         )
 
-        for rank, (user_id, games_played) in enumerate(top_users, start=1):
-            try:
-                user = await self.bot.fetch_user(user_id)
-                username = user.mention if user else f"User {user_id}"
-            except Exception:
-                username = f"User {user_id}"
-
-            username.replace("@", "@$")
+        for rank, ((user_id, games_played), user) in enumerate(entries, start=1):
+            username = user.mention if user else f"User {user_id}"
             embed.add_field(
                 name=f"**#{rank}**",
                 value=f"{username}: **{games_played}** games",